@@ -1,19 +1,23 @@
+import os
+
+# Must be set before numpy and TensorFlow initialise their thread pools
+os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+os.environ.setdefault('OMP_NUM_THREADS', '2')
+
 import flwr as fl
 import logging
-import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler
-from sklearn.model_selection import train_test_split
+import pyarrow.csv as pa_csv
+from sklearn.neighbors import NearestNeighbors
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import Dense, Dropout, BatchNormalization
 from tensorflow.keras.callbacks import LearningRateScheduler, EarlyStopping
 import tensorflow as tf
-from sklearn.metrics import f1_score, accuracy_score
+from sklearn.metrics import f1_score
 import argparse
+import json
+import math
 import grpc
-import time
-from datetime import datetime
-from imblearn.over_sampling import SMOTE
 
 # Configure logging
 logger = logging.getLogger("client")
@@ -26,6 +30,17 @@ logger.addHandler(stream_handler)
 SCRIPT_VERSION = "2025-05-09-v4"
 logger.info(f"Running client.py version: {SCRIPT_VERSION}")
 
+# The model is tiny, so pin it to CPU with a small thread pool to cut launch and scheduling overhead
+tf.config.set_visible_devices([], 'GPU')
+tf.config.threading.set_intra_op_parallelism_threads(2)
+tf.config.threading.set_inter_op_parallelism_threads(1)
+
+# Keras dtype policies for --mixed-precision; bf16 only pays off on CPUs with AVX512-BF16/AMX
+MIXED_PRECISION_POLICIES = {'off': 'float32', 'bf16': 'mixed_bfloat16'}
+
+# Upper bound for a single gRPC message; the full fp32 model is well under 1 MB
+GRPC_MAX_MESSAGE_LENGTH = 16 * 1024 * 1024
+
 def build_model(input_dim, device_name):
     """Build an enhanced neural network model matching the server's architecture."""
     model = Sequential([
@@ -38,7 +53,7 @@ def build_model(input_dim, device_name):
         Dense(64, activation='relu'),
         BatchNormalization(),
         Dropout(0.2),
-        Dense(6, activation='softmax')
+        Dense(6, activation='softmax', dtype='float32')  # Keep the softmax output in float32
     ])
     logger.info(f"Client {device_name}: Built model with {len(model.get_weights())} weight arrays")
     return model
@@ -50,13 +65,88 @@ def lr_schedule(epoch):
     lr = initial_lr * (1.0 / (1.0 + decay * epoch))
     return lr
 
-def balance_data_with_smote(X, y):
-    """Balance the dataset using SMOTE, adjusting k_neighbors dynamically."""
-    class_dist = pd.Series(y).value_counts()
-    logger.info(f"Class distribution before SMOTE: {dict(class_dist)}")
+def reset_optimizer(optimizer):
+    """Zero the optimizer's step count and moment estimates, leaving its learning rate untouched."""
+    learning_rate = optimizer.learning_rate
+    for var in optimizer.variables:
+        if var is not learning_rate:
+            var.assign(tf.zeros_like(var))
+
+def class_distribution(y):
+    """Count samples per class label, omitting empty classes."""
+    counts = np.bincount(np.asarray(y, dtype=np.int64), minlength=6)
+    return {int(label): int(count) for label, count in enumerate(counts) if count}
+
+def quantize_int8(x):
+    """Symmetric per-tensor int8 quantization, returns (scale, q)."""
+    max_abs = float(np.max(np.abs(x)))
+    scale = np.array([max_abs / 127.0 if max_abs > 0 else 1.0], dtype=np.float32)
+    q = np.clip(np.round(x / scale[0]), -127, 127).astype(np.int8)
+    return scale, q
+
+def dequantize_int8(scale, q):
+    """Inverse of quantize_int8."""
+    return q.astype(np.float32) * scale[0]
+
+TWO_BIT_SHIFTS = np.arange(16, dtype=np.uint32) * 2
+
+def quantize_2bit(x, threshold):
+    """Threshold-quantize to {-t, 0, +t} and pack 16 two-bit codes per uint32."""
+    flat = x.ravel()
+    codes = np.zeros(-(-flat.size // 16) * 16, dtype=np.uint32)
+    codes[:flat.size][flat >= threshold] = 1
+    codes[:flat.size][flat <= -threshold] = 2
+    packed = np.bitwise_or.reduce(codes.reshape(-1, 16) << TWO_BIT_SHIFTS, axis=1)
+    return np.array([threshold], dtype=np.float32), packed.astype(np.uint32)
+
+def dequantize_2bit(threshold, packed, shape):
+    """Inverse of quantize_2bit."""
+    size = int(np.prod(shape))
+    codes = ((packed[:, None] >> TWO_BIT_SHIFTS) & 3).ravel()[:size]
+    values = np.zeros(size, dtype=np.float32)
+    values[codes == 1] = threshold[0]
+    values[codes == 2] = -threshold[0]
+    return values.reshape(shape)
+
+def positive_float(value):
+    """argparse type for floats that must be finite and strictly positive."""
+    value = float(value)
+    if not math.isfinite(value) or value <= 0:
+        raise argparse.ArgumentTypeError(f"must be a finite number > 0, got {value}")
+    return value
+
+def unit_fraction(value):
+    """argparse type for fractions in (0, 1]."""
+    value = float(value)
+    if not 0 < value <= 1:
+        raise argparse.ArgumentTypeError(f"must be in (0, 1], got {value}")
+    return value
+
+def enable_grpc_compression(algorithm=grpc.Compression.Gzip):
+    """Make the gRPC channels Flower opens compress messages by default.
+
+    Flower does not forward channel options, so the grpc channel factories are wrapped instead.
+    """
+    insecure_channel, secure_channel = grpc.insecure_channel, grpc.secure_channel
+
+    def compressed_insecure_channel(target, options=None, compression=None):
+        return insecure_channel(target, options=options, compression=algorithm if compression is None else compression)
+
+    def compressed_secure_channel(target, credentials, options=None, compression=None):
+        return secure_channel(target, credentials, options=options, compression=algorithm if compression is None else compression)
+
+    grpc.insecure_channel = compressed_insecure_channel
+    grpc.secure_channel = compressed_secure_channel
+
+def balance_data_with_smote(X, y, random_state=42):
+    """Balance the dataset using a vectorized SMOTE, adjusting k_neighbors dynamically."""
+    X = np.asarray(X, dtype=np.float32)
+    y = np.asarray(y, dtype=np.int32)
+    class_dist = class_distribution(y)
+    logger.info(f"Class distribution before SMOTE: {class_dist}")
     
     # Check if any class has fewer than 2 samples
-    min_samples = class_dist.min()
+    min_samples = min(class_dist.values())
     if min_samples < 2:
         logger.warning("Some classes have fewer than 2 samples. Skipping SMOTE and relying on class weights.")
         return X, y
@@ -66,33 +156,74 @@ def balance_data_with_smote(X, y):
     logger.info(f"Using k_neighbors={k_neighbors} for SMOTE based on smallest class size ({min_samples} samples)")
     
     try:
-        smote = SMOTE(k_neighbors=k_neighbors, random_state=42)
-        X_balanced, y_balanced = smote.fit_resample(X, y)
-        logger.info(f"Class distribution after SMOTE: {dict(pd.Series(y_balanced).value_counts())}")
+        # Oversample every class up to the majority count
+        max_count = max(class_dist.values())
+        n_synthetic = {label: max_count - count for label, count in class_dist.items()}
+        n_total = len(y) + sum(n_synthetic.values())
+
+        # Preallocate the output once instead of concatenating per sample
+        X_balanced = np.empty((n_total, X.shape[1]), dtype=np.float32)
+        y_balanced = np.empty(n_total, dtype=np.int32)
+        X_balanced[:len(y)] = X
+        y_balanced[:len(y)] = y
+
+        rng = np.random.default_rng(random_state)
+        offset = len(y)
+        for label, n in n_synthetic.items():
+            if n == 0:
+                continue
+            X_min = X[y == label]
+            # Parallel kd-tree neighbour search dominates SMOTE's runtime
+            nn = NearestNeighbors(n_neighbors=k_neighbors + 1, algorithm='kd_tree', n_jobs=-1).fit(X_min)
+            neighbors = nn.kneighbors(X_min, return_distance=False)[:, 1:]
+
+            # Interpolate all synthetic samples for this class in one shot
+            base_idx = rng.integers(0, len(X_min), size=n)
+            neigh_idx = neighbors[base_idx, rng.integers(0, k_neighbors, size=n)]
+            steps = rng.uniform(size=(n, 1)).astype(np.float32)
+            X_base = X_min[base_idx]
+            X_balanced[offset:offset + n] = X_base + steps * (X_min[neigh_idx] - X_base)
+            y_balanced[offset:offset + n] = label
+            offset += n
+
+        logger.info(f"Class distribution after SMOTE: {class_distribution(y_balanced)}")
         return X_balanced, y_balanced
     except Exception as e:
         logger.error(f"SMOTE failed: {e}. Falling back to original data with class weights.")
         return X, y
 
-def run_client(device_name, X_dev, y_dev):
+def run_client(device_name, X_dev, y_dev, compression='none', threshold=0.005, topk_ratio=1.0, use_smote=False,
+               strict=False, mixed_precision='off'):
     """Run the federated learning client for a specific device."""
     logger.info(f"🖥️ Running client for device: {device_name}")
-    class_dist = dict(pd.Series(y_dev).value_counts())
+    class_dist = class_distribution(y_dev)
     logger.info(f"Client {device_name}: Class distribution before balancing: {class_dist}")
 
-    # Balance data using SMOTE
-    X_dev, y_dev = balance_data_with_smote(X_dev, y_dev)
+    # Balance data using SMOTE; by default the weighted loss alone handles imbalance
+    if use_smote:
+        X_dev, y_dev = balance_data_with_smote(X_dev, y_dev)
+    else:
+        logger.info(f"Client {device_name}: SMOTE disabled, relying on class weights")
+    X_dev = np.ascontiguousarray(X_dev, dtype=np.float32)
+    y_dev = np.ascontiguousarray(y_dev, dtype=np.int32)
 
     # Verify data integrity
     logger.info(f"Client {device_name}: Input feature range - min: {np.min(X_dev):.4f}, max: {np.max(X_dev):.4f}")
-    if np.any(np.isnan(X_dev)) or np.any(np.isinf(X_dev)):
+    if not np.isfinite(X_dev).all():
         logger.error(f"Client {device_name}: Input data X_dev contains NaN or Inf values.")
         raise ValueError("Input data X_dev contains NaN or Inf values.")
-    if np.any(np.isnan(y_dev)) or np.any(np.isinf(y_dev)):
+    if strict and not np.isfinite(y_dev).all():
         logger.error(f"Client {device_name}: Labels y_dev contain NaN or Inf values.")
         raise ValueError("Labels y_dev contain NaN or Inf values.")
 
+    # The policy must be in place before the layers are built; variables stay float32 either way
+    tf.keras.mixed_precision.set_global_policy(MIXED_PRECISION_POLICIES[mixed_precision])
     model = build_model(X_dev.shape[1], device_name)
+    model.compile(
+        optimizer=tf.keras.optimizers.AdamW(learning_rate=0.001),
+        loss='sparse_categorical_crossentropy',
+        metrics=['accuracy']
+    )
     X_labeled, y_labeled = X_dev, y_dev
 
     logger.info(f"Client {device_name}: Labeled data: {len(X_labeled)} samples")
@@ -100,99 +231,138 @@ def run_client(device_name, X_dev, y_dev):
     class FeSEMClient(fl.client.NumPyClient):
         def __init__(self, X_labeled, y_labeled):
             self.round = 0
+            self.last_loss = 0.0
+            self.last_global = None
             self.X_labeled = X_labeled
-            self.y_labeled = y_labeled
-            self.metrics_history = {
-                'loss': [],
-                'accuracy': [],
-                'f1_score': []
-            }
+            compute_dtype = tf.keras.mixed_precision.global_policy().compute_dtype
+            self.X_labeled_tensor = tf.cast(tf.constant(X_labeled), compute_dtype)
+            self.y_labeled = np.asarray(y_labeled, dtype=np.int32)
+            # Quantization and sparsification error carried over to the next round's update
+            self.residual = [np.zeros_like(w) for w in model.get_weights()]
+            self.lr_scheduler = LearningRateScheduler(lr_schedule)
+            self.early_stopping = EarlyStopping(monitor='loss', patience=3, restore_best_weights=True, verbose=0)
+            self.loss_fn = tf.keras.losses.SparseCategoricalCrossentropy(reduction='none')
+            # Traced once for the fixed feature width so evaluate skips retracing and eager dispatch;
+            # XLA compiles just this forward pass, fusing the Dense/BatchNorm chain
+            self.forward = tf.function(
+                lambda x: model(x, training=False),
+                input_signature=[tf.TensorSpec((None, X_labeled.shape[1]), compute_dtype)],
+                jit_compile=True
+            ).get_concrete_function()
+
+            # Labels are fixed for the client's lifetime, so class weights are computed once
+            unique, counts = np.unique(self.y_labeled, return_counts=True)
+            if len(unique) == 0 or any(c == 0 for c in counts):
+                logger.warning(f"Client {device_name}: Invalid class distribution, using uniform weights")
+                self.class_weights = {i: 1.0 for i in range(6)}
+            else:
+                total_samples = len(self.y_labeled)
+                num_classes = len(unique)
+                self.class_weights = {int(k): (total_samples / (num_classes * v)) for k, v in zip(unique, counts)}
+            logger.info(f"Client {device_name}: Class weights: {self.class_weights}")
+            weight_lut = np.zeros(6, dtype=np.float32)
+            weight_lut[list(self.class_weights)] = list(self.class_weights.values())
+            self.sample_weights = weight_lut[self.y_labeled.astype(np.intp)]
+
+            # Cached once and reshuffled every epoch, as model.fit does for in-memory arrays
+            self.train_ds = (
+                tf.data.Dataset.from_tensor_slices((self.X_labeled, self.y_labeled, self.sample_weights))
+                .cache()
+                .shuffle(max(len(self.y_labeled), 1), reshuffle_each_iteration=True)
+                .batch(64)
+                .prefetch(tf.data.AUTOTUNE)
+            )
+            # Metrics are appended one JSON line per round rather than rewriting the whole history
+            self.metrics_file = f"C:/Users/rkjra/Desktop/FL/FeSEM/client_{device_name}_metrics.jsonl"
+            self.metrics_fh = open(self.metrics_file, 'w', buffering=1)
 
         def get_parameters(self, config):
             """Return model parameters."""
             logger.info(f"Client {device_name}: get_parameters called with config: {config}")
             weights = model.get_weights()
-            if any(np.any(np.isnan(w)) for w in weights):
+            # Weights can only go non-finite after a diverged round, so skip the scan otherwise
+            check_weights = strict or not np.isfinite(self.last_loss)
+            if check_weights and not all(np.isfinite(w).all() for w in weights):
                 logger.error(f"Client {device_name}: Model weights contain NaN values.")
                 raise ValueError("Model weights contain NaN values.")
             logger.info(f"Client {device_name}: Sending {len(weights)} weight arrays to server")
             return weights
 
+        def encode_update(self):
+            """Encode the delta from the last received weights for upload, sparsifying/quantizing if enabled."""
+            sparse = topk_ratio < 1.0
+            payload = []
+            for i, (w_new, w_old) in enumerate(zip(model.get_weights(), self.last_global)):
+                delta = (w_new - w_old + self.residual[i]).ravel()
+                if sparse:
+                    k = max(1, int(np.ceil(topk_ratio * delta.size)))
+                    indices = np.argpartition(np.abs(delta), -k)[-k:].astype(np.int32)
+                    values = delta[indices]
+                    payload.append(indices)
+                else:
+                    values = delta
+                if compression == 'int8':
+                    scale, q = quantize_int8(values)
+                    sent_values = dequantize_int8(scale, q)
+                    payload.extend([scale, q])
+                elif compression == '2bit':
+                    scale, q = quantize_2bit(values, threshold)
+                    sent_values = dequantize_2bit(scale, q, values.shape)
+                    payload.extend([scale, q])
+                else:
+                    # Sparse values go as float16, dense deltas at full precision
+                    payload.append(values.astype(np.float16) if sparse else values)
+                    sent_values = payload[-1].astype(np.float32)
+                if sparse:
+                    sent = np.zeros_like(delta)
+                    sent[indices] = sent_values
+                else:
+                    sent = sent_values
+                self.residual[i] = (delta - sent).reshape(w_new.shape)
+            return payload
+
         def fit(self, parameters, config):
             """Train the model on local data."""
             self.round += 1
             logger.info(f"Client {device_name}: fit called for round {self.round} with config: {config}")
-            logger.info(f"Client {device_name}: Type of parameters received in fit: {type(parameters)}")
-            if not isinstance(parameters, fl.common.Parameters):
-                logger.warning(f"Client {device_name}: Expected Parameters object in fit, got {type(parameters)}, attempting to convert")
-                try:
-                    parameters = fl.common.ndarrays_to_parameters(parameters)
-                except Exception as e:
-                    logger.error(f"Client {device_name}: Failed to convert parameters to Parameters object: {e}")
-                    raise
-
-            global_weights = fl.common.parameters_to_ndarrays(parameters)
+            # The NumPyClient adapter already hands over a list of ndarrays
+            global_weights = parameters
+            self.last_global = global_weights
             logger.info(f"Client {device_name}: Received {len(global_weights)} weight arrays from server in fit")
+            upload_info = {"compression": compression, "sparse": topk_ratio < 1.0}
             try:
                 model.set_weights(global_weights)
             except ValueError as e:
                 logger.error(f"Client {device_name}: Failed to set weights in fit: {e}")
                 raise
+            reset_optimizer(model.optimizer)
 
-            # Compute class weights
-            unique, counts = np.unique(self.y_labeled, return_counts=True)
-            if len(unique) == 0 or any(c == 0 for c in counts):
-                logger.warning(f"Client {device_name}: Invalid class distribution for round {self.round}, using uniform weights")
-                class_weights = {i: 1.0 for i in range(6)}
-            else:
-                total_samples = len(self.y_labeled)
-                num_classes = len(unique)
-                class_weights = {k: (total_samples / (num_classes * v)) for k, v in zip(unique, counts)}
-            logger.info(f"Client {device_name}: Round {self.round} class weights: {class_weights}")
-
-            sample_weights = np.array([class_weights[label] for label in self.y_labeled])
-
-            model.compile(
-                optimizer=tf.keras.optimizers.AdamW(learning_rate=0.001),
-                loss='sparse_categorical_crossentropy',
-                metrics=['accuracy']
-            )
-
-            lr_scheduler = LearningRateScheduler(lr_schedule)
-            early_stopping = EarlyStopping(monitor='loss', patience=3, restore_best_weights=True, verbose=0)
             history = model.fit(
-                self.X_labeled, self.y_labeled,
+                self.train_ds,
                 epochs=5,
-                batch_size=64,
-                sample_weight=sample_weights,
-                callbacks=[lr_scheduler, early_stopping],
+                callbacks=[self.lr_scheduler, self.early_stopping],
                 verbose=0
             )
 
             if not history.history or 'loss' not in history.history:
                 logger.error(f"Client {device_name}: Training failed for round {self.round}, history invalid")
-                return (model.get_weights(), len(self.X_labeled), {"loss": 0.0})
+                return (self.encode_update(), len(self.X_labeled), {"loss": 0.0, **upload_info})
 
+            self.last_loss = float(history.history['loss'][-1])
             if any(np.isnan(history.history['loss'])):
                 logger.error(f"Client {device_name}: Training produced NaN loss in round {self.round}")
-                return (model.get_weights(), len(self.X_labeled), {"loss": 0.0})
+                # Discard the diverged weights so NaNs don't leak into the residual
+                model.set_weights(global_weights)
+                return (self.encode_update(), len(self.X_labeled), {"loss": 0.0, **upload_info})
 
             logger.info(f"Client {device_name}: Training completed for round {self.round}, loss: {history.history['loss'][-1]:.4f}, accuracy: {history.history['accuracy'][-1]:.4f}")
-            return (model.get_weights(), len(self.X_labeled), {"loss": float(history.history['loss'][-1])})
+            return (self.encode_update(), len(self.X_labeled), {"loss": float(history.history['loss'][-1]), **upload_info})
 
         def evaluate(self, parameters, config):
             """Evaluate the model on local data."""
             logger.info(f"Client {device_name}: evaluate called with config: {config}")
-            logger.info(f"Client {device_name}: Type of parameters received in evaluate: {type(parameters)}")
-            if not isinstance(parameters, fl.common.Parameters):
-                logger.warning(f"Client {device_name}: Expected Parameters object in evaluate, got {type(parameters)}, attempting to convert")
-                try:
-                    parameters = fl.common.ndarrays_to_parameters(parameters)
-                except Exception as e:
-                    logger.error(f"Client {device_name}: Failed to convert parameters to Parameters object: {e}")
-                    raise
-
-            global_weights = fl.common.parameters_to_ndarrays(parameters)
+            # The NumPyClient adapter already hands over a list of ndarrays
+            global_weights = parameters
             logger.info(f"Client {device_name}: Received {len(global_weights)} weight arrays from server in evaluate")
             try:
                 model.set_weights(global_weights)
@@ -200,118 +370,119 @@ def run_client(device_name, X_dev, y_dev):
                 logger.error(f"Client {device_name}: Failed to set weights in evaluate: {e}")
                 raise
 
-            unique, counts = np.unique(self.y_labeled, return_counts=True)
-            if len(unique) == 0 or any(c == 0 for c in counts):
-                logger.warning(f"Client {device_name}: Invalid class distribution for evaluation, using uniform weights")
-                class_weights = {i: 1.0 for i in range(6)}
-            else:
-                total_samples = len(self.y_labeled)
-                num_classes = len(unique)
-                class_weights = {k: (total_samples / (num_classes * v)) for k, v in zip(unique, counts)}
-            logger.info(f"Client {device_name}: Evaluation class weights: {class_weights}")
-
-            sample_weights = np.array([class_weights[label] for label in self.y_labeled])
-
-            model.compile(
-                optimizer=tf.keras.optimizers.AdamW(learning_rate=0.001),
-                loss='sparse_categorical_crossentropy',
-                metrics=['accuracy'],
-                weighted_metrics=['accuracy']
-            )
-
             if len(self.X_labeled) == 0 or len(self.y_labeled) == 0:
                 logger.warning(f"Client {device_name}: No data for evaluation in round {self.round}")
                 return 0.0, 0, {"accuracy": 0.0, "f1_score": 0.0}
 
             try:
-                evaluation_results = model.evaluate(
-                    self.X_labeled, self.y_labeled,
-                    sample_weight=sample_weights,
-                    verbose=0
-                )
-                loss, unweighted_acc, weighted_acc = evaluation_results
+                # Single forward pass; loss, accuracies and F1 are all derived from it
+                y_prob = self.forward(self.X_labeled_tensor).numpy()
+                y_pred_classes = np.argmax(y_prob, axis=1)
+                loss = float(np.mean(self.loss_fn(self.y_labeled, y_prob, sample_weight=self.sample_weights)))
+                correct = y_pred_classes == self.y_labeled
+                unweighted_acc = float(np.mean(correct))
+                weighted_acc = float(np.sum(self.sample_weights * correct) / np.sum(self.sample_weights))
                 logger.info(f"Client {device_name}: Evaluation - Loss: {loss:.4f}, Unweighted Accuracy: {unweighted_acc:.4f}, Weighted Accuracy: {weighted_acc:.4f}")
 
-                y_pred = model.predict(self.X_labeled, verbose=0)
-                y_pred_classes = np.argmax(y_pred, axis=1)
                 f1 = f1_score(self.y_labeled, y_pred_classes, average='weighted')
-                pred_dist = dict(pd.Series(y_pred_classes).value_counts())
+                pred_dist = class_distribution(y_pred_classes)
                 logger.info(f"Client {device_name}: Prediction distribution on evaluation: {pred_dist}")
 
-                class_acc = {}
-                for label in range(6):
-                    mask = self.y_labeled == label
-                    if mask.sum() > 0:
-                        class_acc[label] = accuracy_score(self.y_labeled[mask], y_pred_classes[mask])
+                totals = np.bincount(self.y_labeled, minlength=6)
+                hits = np.bincount(self.y_labeled, weights=correct, minlength=6)
+                class_acc = {label: float(hits[label] / totals[label]) for label in range(6) if totals[label] > 0}
                 logger.info(f"Client {device_name}: Class-wise accuracy: {class_acc}")
             except Exception as e:
                 logger.error(f"Client {device_name}: Error in evaluation: {e}")
                 return 0.0, 0, {"accuracy": 0.0, "f1_score": 0.0}
 
             logger.info(f"Client {device_name} - Loss: {loss:.4f}, Weighted Accuracy: {weighted_acc:.4f}, F1-Score: {f1:.4f}")
-            self.metrics_history['loss'].append((self.round, float(loss)))
-            self.metrics_history['accuracy'].append((self.round, float(weighted_acc)))
-            self.metrics_history['f1_score'].append((self.round, float(f1)))
-            metrics_file = f"C:/Users/rkjra/Desktop/FL/FeSEM/client_{device_name}_metrics.npy"
-            np.save(metrics_file, self.metrics_history)
-            logger.info(f"Client {device_name}: Saved evaluation metrics to {metrics_file}")
+            self.metrics_fh.write(json.dumps({
+                'round': self.round,
+                'loss': float(loss),
+                'accuracy': float(weighted_acc),
+                'f1_score': float(f1)
+            }) + '\n')
+            logger.info(f"Client {device_name}: Saved evaluation metrics to {self.metrics_file}")
             return loss, len(self.X_labeled), {"accuracy": weighted_acc, "f1_score": f1}
 
     server_address = "127.0.0.1:9000"
     logger.info(f"🔗 Attempting to connect to server at: {server_address}")
-    max_retries = 10
-    retry_delay = 10
-    for attempt in range(max_retries):
-        try:
-            logger.info(f"Client {device_name}: Connection attempt {attempt + 1}/{max_retries} at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-            channel = grpc.insecure_channel(server_address)
-            grpc.channel_ready_future(channel).result(timeout=30)
-            fl.client.start_numpy_client(
-                server_address=server_address,
-                client=FeSEMClient(X_labeled, y_labeled)
-            )
-            channel.close()
-            logger.info(f"🔌 gRPC channel closed for {device_name}")
-            logger.info(f"✅ Client {device_name} completed.")
-            break
-        except Exception as e:
-            logger.warning(f"Attempt {attempt + 1}/{max_retries} failed: {e}")
-            if attempt < max_retries - 1:
-                logger.info(f"Client {device_name}: Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-            else:
-                logger.error(f"❌ Client {device_name}: Failed after {max_retries} attempts: {e}")
-                raise
+    # A single client instance survives reconnects so its residual buffers are kept
+    client = FeSEMClient(X_labeled, y_labeled)
+    try:
+        # Flower retries the connection itself, with backoff, up to these limits
+        fl.client.start_client(
+            server_address=server_address,
+            client=client.to_client(),
+            grpc_max_message_length=GRPC_MAX_MESSAGE_LENGTH,
+            max_retries=10,
+            max_wait_time=300
+        )
+        logger.info(f"✅ Client {device_name} completed.")
+    except Exception as e:
+        logger.error(f"❌ Client {device_name}: Failed: {e}")
+        raise
+    finally:
+        client.metrics_fh.close()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run a federated learning client for a specific device.")
     parser.add_argument('--device', type=str, choices=['L', 'M', 'H'], required=True)
+    parser.add_argument('--compression', type=str, choices=['none', 'int8', '2bit'], default='none',
+                        help='Quantize the weight delta sent to the server')
+    parser.add_argument('--threshold', type=positive_float, default=0.005, help='Threshold for 2-bit quantization (> 0)')
+    parser.add_argument('--topk', type=unit_fraction, default=1.0,
+                        help='Fraction in (0, 1] of largest-magnitude delta entries sent per tensor (1.0 sends all)')
+    parser.add_argument('--use-smote', action='store_true', help='Oversample minority classes with SMOTE')
+    parser.add_argument('--no-grpc-compression', action='store_true', help='Disable gzip on the gRPC transport')
+    parser.add_argument('--strict', action='store_true', help='Run every data and weight integrity check')
+    parser.add_argument('--mixed-precision', type=str, choices=list(MIXED_PRECISION_POLICIES), default='off',
+                        help='Compute in bfloat16 (only faster on CPUs with native BF16 support)')
     args = parser.parse_args()
     device = args.device
 
-    df = pd.read_csv("D:/FEDERATED LEARNING PROJECT/predictive_maintenance.csv")
-    df["Failure_Code"] = df["Failure Type"].astype("category").cat.codes
-    df["Device_Type"] = df["Type"].astype("category").cat.codes
+    table = pa_csv.read_csv("D:/FEDERATED LEARNING PROJECT/predictive_maintenance.csv")
+    _, failure_code = np.unique(table.column("Failure Type").to_numpy(), return_inverse=True)
+    _, device_type = np.unique(table.column("Type").to_numpy(), return_inverse=True)
 
     features = ['Air temperature [K]', 'Process temperature [K]', 'Rotational speed [rpm]', 
-                'Torque [Nm]', 'Tool wear [min]', 'Device_Type']
-    X, y = df[features], df['Failure_Code']
-    X_train, X_test, y_train, y_test, df_train, df_test = train_test_split(
-        X, y, df, test_size=0.2, random_state=42, stratify=y
-    )
-
-    scaler = StandardScaler()
-    X_scaled_train = scaler.fit_transform(X_train)
-    X_scaled_test = scaler.transform(X_test)
-    np.save("C:/Users/rkjra/Desktop/FL/FeSEM/X_test.npy", X_scaled_test)
+                'Torque [Nm]', 'Tool wear [min]']
+    X = np.empty((table.num_rows, len(features) + 1), dtype=np.float32)
+    for i, feature in enumerate(features):
+        X[:, i] = table.column(feature).to_numpy()
+    X[:, -1] = device_type
+    y = failure_code.astype(np.int32)
+
+    rng = np.random.default_rng(42)
+    test_mask = rng.random(len(y)) < 0.2
+    X_train, X_test = X[~test_mask], X[test_mask]
+    y_train, y_test = y[~test_mask], y[test_mask]
+    device_type_train = device_type[~test_mask]
+
+    # Standardize in place with training-set statistics
+    mean = X_train.mean(axis=0)
+    std = X_train.std(axis=0)
+    X_train -= mean
+    X_train /= std
+    X_test -= mean
+    X_test /= std
+    np.save("C:/Users/rkjra/Desktop/FL/FeSEM/X_test.npy", X_test)
     np.save("C:/Users/rkjra/Desktop/FL/FeSEM/y_test.npy", y_test)
 
     device_map = {'L': 0, 'M': 1, 'H': 2}
     device_code = device_map[device]
-    X_dev = X_scaled_train[df_train['Device_Type'] == device_code]
-    y_dev = y_train[df_train['Device_Type'] == device_code]
-    class_dist = dict(pd.Series(y_dev).value_counts())
+    X_dev = X_train[device_type_train == device_code]
+    y_dev = y_train[device_type_train == device_code]
+    class_dist = class_distribution(y_dev)
     logger.info(f"Main: {device} class distribution: {class_dist}")
 
+    # Patch the gRPC channel factories once, before Flower opens any channel
+    if not args.no_grpc_compression:
+        enable_grpc_compression()
+        logger.info("Main: gzip compression enabled on the gRPC transport")
+
     logger.info(f"Starting client for device: {device} with {len(y_dev)} samples")
-    run_client(device, X_dev, y_dev)
+    run_client(device, X_dev, y_dev, compression=args.compression, threshold=args.threshold,
+               topk_ratio=args.topk, use_smote=args.use_smote, strict=args.strict,
+               mixed_precision=args.mixed_precision)
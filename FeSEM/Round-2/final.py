@@ -1,6 +1,7 @@
 import numpy as np
 import matplotlib.pyplot as plt
 import os
+import json
 import argparse
 from matplotlib import cm
 
@@ -22,8 +23,17 @@ markers = ['o', 's', 'D'][:num_clients]
 def load_client_metrics(base_dir, client_labels):
     client_metrics = {}
     for client in client_labels:
+        jsonl_path = os.path.join(base_dir, f"client_{client}_metrics.jsonl")
         file_path = os.path.join(base_dir, f"client_{client}_metrics.npy")
-        if os.path.exists(file_path):
+        if os.path.exists(jsonl_path):
+            metrics = {'loss': [], 'accuracy': [], 'f1_score': []}
+            with open(jsonl_path) as f:
+                for line in f:
+                    record = json.loads(line)
+                    for metric in metrics:
+                        metrics[metric].append((record['round'], record[metric]))
+            client_metrics[client] = metrics
+        elif os.path.exists(file_path):
             client_metrics[client] = np.load(file_path, allow_pickle=True).item()
         else:
             print(f"Warning: Metrics file for client {client} not found.")
@@ -32,7 +42,14 @@ def load_client_metrics(base_dir, client_labels):
 def load_server_metrics(base_dir):
     server_metrics_file = os.path.join(base_dir, "metrics_history.npy")
     if os.path.exists(server_metrics_file):
-        return np.load(server_metrics_file, allow_pickle=True).item()
+        metrics = np.load(server_metrics_file, allow_pickle=True)
+        if metrics.dtype == object:  # Legacy pickled dict of (round, value) lists
+            return metrics.item()
+        # One [loss, accuracy, f1_score] row per round; rounds never evaluated are NaN
+        return {
+            metric: [(r + 1, float(metrics[r, i])) for r in range(len(metrics)) if not np.isnan(metrics[r, i])]
+            for i, metric in enumerate(['loss', 'accuracy', 'f1_score'])
+        }
     else:
         raise FileNotFoundError("Server metrics file not found.")
 
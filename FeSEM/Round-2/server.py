@@ -8,6 +8,8 @@ from sklearn.metrics import f1_score, accuracy_score
 import pandas as pd
 from sklearn.preprocessing import StandardScaler
 import time
+import grpc
+import argparse
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -21,7 +23,6 @@ logger.info(f"Running server.py version: {SCRIPT_VERSION}")
 # Global variables
 global_weights = None
 personalized_models = {}
-metrics_history = {"loss": [], "accuracy": [], "f1_score": []}
 momentum = 0.5  # Reduced momentum for stability
 velocity = None
 
@@ -46,6 +47,25 @@ def build_model(input_dim=6):
     )
     return model
 
+def class_distribution(y):
+    """Count samples per class label, omitting empty classes."""
+    counts = np.bincount(np.asarray(y, dtype=np.int64), minlength=6)
+    return {int(label): int(count) for label, count in enumerate(counts) if count}
+
+def enable_grpc_compression(algorithm=grpc.Compression.Gzip):
+    """Make the gRPC server Flower starts compress responses by default.
+
+    Flower does not forward server options, so grpc.server is wrapped instead.
+    """
+    create_server = grpc.server
+
+    def compressed_server(*args, **kwargs):
+        if kwargs.get("compression") is None:
+            kwargs["compression"] = algorithm
+        return create_server(*args, **kwargs)
+
+    grpc.server = compressed_server
+
 def pretrain_model():
     """Pre-train a base model on a subset of data."""
     logger.info("Pre-training base model...")
@@ -64,8 +84,46 @@ def pretrain_model():
     logger.info("Pre-training completed.")
     return model.get_weights()
 
+def dequantize_int8(scale, q):
+    """Rebuild a tensor from the client's symmetric int8 encoding."""
+    return q.astype(np.float32) * scale[0]
+
+TWO_BIT_SHIFTS = np.arange(16, dtype=np.uint32) * 2
+
+def dequantize_2bit(threshold, packed, shape):
+    """Unpack 16 two-bit codes per uint32 into {-t, 0, +t} values."""
+    size = int(np.prod(shape))
+    codes = ((packed[:, None] >> TWO_BIT_SHIFTS) & 3).ravel()[:size]
+    values = np.zeros(size, dtype=np.float32)
+    values[codes == 1] = threshold[0]
+    values[codes == 2] = -threshold[0]
+    return values.reshape(shape)
+
+def decode_update(payload, reference, compression, sparse=False):
+    """Rebuild a client's local weights from its delta upload and the weights it was sent."""
+    arrays = iter(payload)
+    local_weights = []
+    for ref in reference:
+        indices = next(arrays) if sparse else None
+        count = ref.size if indices is None else indices.size
+        if compression == "int8":
+            values = dequantize_int8(next(arrays), next(arrays))
+        elif compression == "2bit":
+            values = dequantize_2bit(next(arrays), next(arrays), (count,))
+        elif compression == "none":
+            values = next(arrays).astype(np.float32)
+        else:
+            raise ValueError(f"Unknown compression mode: {compression}")
+        if sparse:
+            delta = np.zeros(ref.size, dtype=np.float32)
+            delta[indices] = values
+        else:
+            delta = values
+        local_weights.append(ref + delta.reshape(ref.shape))
+    return local_weights
+
 class FeSEM(fl.server.strategy.Strategy):
-    def __init__(self, initial_parameters, min_fit_clients=3, min_evaluate_clients=3, min_available_clients=3):
+    def __init__(self, initial_parameters, min_fit_clients=3, min_evaluate_clients=3, min_available_clients=3, num_rounds=20):
         super().__init__()
         self.initial_parameters = initial_parameters
         self.min_fit_clients = min_fit_clients
@@ -73,6 +131,11 @@ class FeSEM(fl.server.strategy.Strategy):
         self.min_available_clients = min_available_clients
         self.clients_met = False
         self.client_metrics = {}  # Store client metrics for adaptive weighting
+        # Preallocated [loss, accuracy, f1_score] row per round, written in place as rounds finish
+        self.metrics_history = np.lib.format.open_memmap(
+            "C:/Users/rkjra/Desktop/FL/FeSEM/metrics_history.npy", mode="w+", dtype=np.float32, shape=(num_rounds, 3)
+        )
+        self.metrics_history[:] = np.nan
 
     def initialize_parameters(self, client_manager):
         """Initialize global and personalized model parameters."""
@@ -138,11 +201,22 @@ class FeSEM(fl.server.strategy.Strategy):
             total_score = 1.0  # Avoid division by zero
         client_weights = {cid: score / total_score for cid, score in client_scores.items()}
 
+        # Decode client uploads relative to the weights each client was sent
+        local_updates = {}
+        for client, res in results:
+            cid = str(client.cid)
+            local_updates[cid] = decode_update(
+                fl.common.parameters_to_ndarrays(res.parameters),
+                personalized_models.get(cid, global_weights),
+                res.metrics.get("compression", "none"),
+                res.metrics.get("sparse", False)
+            )
+
         # Aggregate updates for the global model
         aggregated_updates = [np.zeros_like(w) for w in global_weights]
         for client, res in results:
             cid = str(client.cid)
-            client_update = fl.common.parameters_to_ndarrays(res.parameters)
+            client_update = local_updates[cid]
             weight = client_weights.get(cid, 1.0 / len(results))
             for i in range(len(client_update)):
                 aggregated_updates[i] += client_update[i] * weight
@@ -155,7 +229,7 @@ class FeSEM(fl.server.strategy.Strategy):
         # Update personalized models
         for client, res in results:
             cid = str(client.cid)
-            local_weights = fl.common.parameters_to_ndarrays(res.parameters)
+            local_weights = local_updates[cid]
             personalized_models[cid] = [
                 0.6 * lw + 0.4 * gw for lw, gw in zip(local_weights, global_weights)
             ]
@@ -194,7 +268,6 @@ class FeSEM(fl.server.strategy.Strategy):
 
     def aggregate_evaluate(self, server_round, results, failures):
         """Aggregate evaluation metrics from clients and store metrics."""
-        global metrics_history
         if not results:
             logger.warning(f"Round {server_round}: No evaluation results received. Failures: {len(failures)}")
             return 0.0, {"accuracy": 0.0, "f1_score": 0.0}
@@ -217,10 +290,8 @@ class FeSEM(fl.server.strategy.Strategy):
         avg_f1 = total_f1 / total_samples
         logger.info(f"Round {server_round} - Loss: {avg_loss:.4f}, Accuracy: {avg_accuracy:.4f}, F1-Score: {avg_f1:.4f}")
 
-        metrics_history["loss"].append((server_round, avg_loss))
-        metrics_history["accuracy"].append((server_round, avg_accuracy))
-        metrics_history["f1_score"].append((server_round, avg_f1))
-        np.save("C:/Users/rkjra/Desktop/FL/FeSEM/metrics_history.npy", metrics_history, allow_pickle=True)
+        self.metrics_history[server_round - 1] = (avg_loss, avg_accuracy, avg_f1)
+        self.metrics_history.flush()
         return avg_loss, {"accuracy": avg_accuracy, "f1_score": avg_f1}
 
     def evaluate(self, server_round, parameters):
@@ -229,7 +300,7 @@ class FeSEM(fl.server.strategy.Strategy):
         try:
             X_test = np.load("C:/Users/rkjra/Desktop/FL/FeSEM/X_test.npy")
             y_test = np.load("C:/Users/rkjra/Desktop/FL/FeSEM/y_test.npy")
-            logger.info(f"Test set class distribution: {dict(pd.Series(y_test).value_counts())}")
+            logger.info(f"Test set class distribution: {class_distribution(y_test)}")
 
             model = build_model(input_dim=X_test.shape[1])
             model.set_weights(fl.common.parameters_to_ndarrays(parameters))
@@ -237,7 +308,7 @@ class FeSEM(fl.server.strategy.Strategy):
             y_pred = model.predict(X_test, verbose=0)
             y_pred_classes = np.argmax(y_pred, axis=1)
             f1 = f1_score(y_test, y_pred_classes, average='weighted')
-            pred_dist = dict(pd.Series(y_pred_classes).value_counts())
+            pred_dist = class_distribution(y_pred_classes)
             logger.info(f"Server prediction distribution: {pred_dist}")
             logger.info(f"Server evaluation in round {server_round} - Loss: {loss:.4f}, Accuracy: {acc:.4f}, F1-Score: {f1:.4f}")
             return loss, {"accuracy": acc, "f1_score": f1}
@@ -248,25 +319,35 @@ class FeSEM(fl.server.strategy.Strategy):
 def run_server():
     """Start the federated learning server."""
     initial_weights = pretrain_model()
+    num_rounds = 20
     strategy = FeSEM(
         initial_parameters=fl.common.ndarrays_to_parameters(initial_weights),
         min_fit_clients=3,
         min_evaluate_clients=3,
-        min_available_clients=3
+        min_available_clients=3,
+        num_rounds=num_rounds
     )
     server_address = "127.0.0.1:9000"
     logger.info(f"🚀 Starting server at: {server_address}")
     try:
         fl.server.start_server(
             server_address=server_address,
-            config=fl.server.ServerConfig(num_rounds=20, round_timeout=300),
+            config=fl.server.ServerConfig(num_rounds=num_rounds, round_timeout=300),
             strategy=strategy
         )
         logger.info("✅ Server finished running.")
     except Exception as e:
         logger.error(f"❌ Server failed: {e}")
         raise
-    np.save("C:/Users/rkjra/Desktop/FL/FeSEM/metrics_history.npy", metrics_history, allow_pickle=True)
+    strategy.metrics_history.flush()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the FeSEM federated learning server.")
+    parser.add_argument('--no-grpc-compression', action='store_true', help='Disable gzip on the gRPC transport')
+    args = parser.parse_args()
+
+    # Patch grpc.server once, before Flower starts the server
+    if not args.no_grpc_compression:
+        enable_grpc_compression()
+        logger.info("gzip compression enabled on the gRPC transport")
     run_server()